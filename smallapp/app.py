@@ -1,13 +1,32 @@
+import bisect
 import hashlib
-import json
+import heapq
+import io
+import math
 import os
 import random
+import re
+import uuid
 from datetime import date, datetime, timedelta
-from functools import wraps
+from functools import lru_cache, wraps
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
+from sqlite3 import Row
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import (
+    Flask,
+    g,
+    get_template_attribute,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_template,
+    url_for,
+)
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import check_password_hash, generate_password_hash
 
 try:
@@ -19,24 +38,34 @@ except ImportError:
 from db import (
     add_cooking_log,
     add_recognition_log,
+    clear_recognize_items,
     create_user,
     fetch_pantry_items,
-    fetch_recipe_by_id,
-    fetch_recipes,
     fetch_recipes_with_ingredients,
     fetch_recognition_logs,
     fetch_cooking_log_count,
     fetch_expiry_alerts,
-    fetch_cooking_logs_range,
+    fetch_daily_nutrition_totals,
+    fetch_recent_cooked_recipes,
+    fetch_recognition_log_count,
     get_user_by_id,
     get_user_by_username,
     init_db,
+    recipes_version,
     seed_data,
     search_recipes,
+    update_user_password_hash,
     upsert_pantry_item,
+    upsert_pantry_items,
     update_pantry_item,
     delete_pantry_item,
+    delete_recognize_item,
+    get_recognize_items,
+    set_recognize_items,
+    update_recognize_item,
 )
+from jsonutil import dumps as json_dumps
+from jsonutil import loads as json_loads
 from services.openai_vision import (
     MissingAPIKeyError,
     NonJsonResponseError,
@@ -47,9 +76,30 @@ from services.openai_vision import (
 
 load_dotenv()
 
+
+class JSONProvider(DefaultJSONProvider):
+    """Route Flask's JSON handling through jsonutil (orjson when available)."""
+
+    def dumps(self, obj, **kwargs):
+        return json_dumps(
+            obj,
+            default=kwargs.get("default", self.default),
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            indent=bool(kwargs.get("indent")),
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+
 app = Flask(__name__)
+app.json = JSONProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key")
 
+# Full werkzeug method string including the cost parameters; hashes made with
+# any other method are upgraded on the next successful login.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+
 
 DEMO_IMAGE_GROUPS: Tuple[Tuple[str, str], ...] = (
     ("fridge", "fridege"),
@@ -57,11 +107,64 @@ DEMO_IMAGE_GROUPS: Tuple[Tuple[str, str], ...] = (
     ("table", "table"),
 )
 DEMO_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+RECIPE_SUGGESTION_LIMIT = 15
+UPLOAD_CHUNK_SIZE = 64 * 1024
+DEMO_CACHE_MEMORY_SIZE = 128
+
+
+def _source_fingerprint() -> str:
+    """Hash of the code, recipe data and templates the /recipes page is built from.
+
+    Deterministic, so every worker hands out the same ETags, while a deploy
+    that changes any of these files invalidates the old ones.
+    """
+    root = Path(app.root_path)
+    hasher = hashlib.blake2b(digest_size=8)
+    for path in (
+        root / "app.py",
+        root / "recipes_data.py",
+        *sorted((root / "templates").rglob("*.html")),
+    ):
+        hasher.update(path.read_bytes())
+    return hasher.hexdigest()
+
+
+RECIPES_VERSION = _source_fingerprint()
+
+_MOCK_POOL = ("鶏むね肉", "卵", "ブロッコリー", "牛乳", "ご飯", "豆腐", "トマト", "玉ねぎ")
+_KEYWORD_MAP = {
+    "chicken": "鶏むね肉",
+    "egg": "卵",
+    "broccoli": "ブロッコリー",
+    "milk": "牛乳",
+    "rice": "ご飯",
+    "tofu": "豆腐",
+    "tomato": "トマト",
+    "onion": "玉ねぎ",
+}
+_UNIT_MAP = {
+    "卵": "個",
+    "トマト": "個",
+    "鶏むね肉": "枚",
+    "ブロッコリー": "株",
+    "牛乳": "本",
+    "ご飯": "杯",
+    "豆腐": "丁",
+}
+# Lookahead so overlapping keywords (e.g. "ricegg") are all found in one scan.
+# ASCII-only case folding replaces a full Unicode filename.lower().
+_KEYWORD_PATTERN = re.compile(
+    "(?=(%s))" % "|".join(map(re.escape, _KEYWORD_MAP)), re.IGNORECASE | re.ASCII
+)
+_MOCK_RNG = random.Random()
 
 
 with app.app_context():
     init_db()
     seed_data()
+    # Compile every template up front so the first request doesn't pay for it.
+    for template_name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(template_name)
 
 
 def login_required(view):
@@ -75,13 +178,58 @@ def login_required(view):
 
 
 def current_user():
-    user_id = session.get("user_id")
-    if not user_id:
-        return None
-    return get_user_by_id(user_id)
+    """Load the logged-in user at most once per request."""
+    if "user" not in g:
+        user_id = session.get("user_id")
+        g.user = get_user_by_id(user_id) if user_id else None
+    return g.user
+
+
+def _get_pantry_items(user_id: int) -> List[Row]:
+    """Fetch the user's pantry at most once per request."""
+    if "pantry_items" not in g:
+        g.pantry_items = fetch_pantry_items(user_id)
+    return g.pantry_items
 
 
+def _get_pantry_names(user_id: int) -> frozenset:
+    """Names of the user's pantry items, built once per request."""
+    if "pantry_names" not in g:
+        g.pantry_names = frozenset(item["name"] for item in _get_pantry_items(user_id))
+    return g.pantry_names
+
+
+def _get_expiry_alerts(user_id: int) -> List[Row]:
+    """Fetch the user's expiry alerts at most once per request."""
+    if "expiry_alerts" not in g:
+        g.expiry_alerts = fetch_expiry_alerts(user_id)
+    return g.expiry_alerts
+
+
+@lru_cache(maxsize=2)
+def _last_7_days(ordinal: int) -> Tuple[Tuple[date, ...], Tuple[str, ...]]:
+    """Return the week ending on the given day as dates and ISO labels."""
+    today = date.fromordinal(ordinal)
+    days = tuple(today - timedelta(days=offset) for offset in range(6, -1, -1))
+    return days, tuple(day.isoformat() for day in days)
+
+
+def _hash_password(password: str) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD, salt_length=16)
+
+
+def _verify_password(user: Row, password: str) -> bool:
+    password_hash = user["password_hash"]
+    if not check_password_hash(password_hash, password):
+        return False
+    if password_hash.split("$", 1)[0] != PASSWORD_HASH_METHOD:
+        update_user_password_hash(user["id"], _hash_password(password))
+    return True
+
+
+@lru_cache(maxsize=1)
 def _build_demo_catalog() -> List[Dict[str, List[str]]]:
+    """Scan the demo image folders once; call ``cache_clear()`` to rescan."""
     base_dir = Path(app.root_path) / "static"
     catalog: List[Dict[str, List[str]]] = []
     for key, rel_path in DEMO_IMAGE_GROUPS:
@@ -99,37 +247,119 @@ def _build_demo_catalog() -> List[Dict[str, List[str]]]:
     return catalog
 
 
-def _demo_cache_path(image_bytes: bytes) -> Path:
-    digest = hashlib.sha256(image_bytes).hexdigest()
+def _health_score(nutrition: Dict[str, Any]) -> int:
+    health_score = 0
+    if nutrition.get("protein", 0) >= 30:
+        health_score += 10
+    if nutrition.get("veg_score", 0) >= 2:
+        health_score += 10
+    if nutrition.get("kcal", 0) <= 500:
+        health_score += 10
+    if nutrition.get("fat", 0) <= 15:
+        health_score += 10
+    if nutrition.get("carb", 0) >= 70:
+        health_score -= 10
+    return max(0, min(40, health_score))
+
+
+def _recipes_cache() -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+    return _recipes_cache_for(recipes_version())
+
+
+@lru_cache(maxsize=1)
+def _recipes_cache_for(version: int) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+    """Recipes are seed data, so fetch and index them once per recipes version."""
+    recipes_list: List[Dict[str, Any]] = []
+    for recipe in fetch_recipes_with_ingredients():
+        candidates = recipe.pop("linked_ingredients") or recipe["ingredients"]
+        required = [ing for ing in candidates if ing.get("role") == "required"]
+        recipe["required_ingredients"] = required or candidates
+        recipe["required_names"] = frozenset(
+            ing["name"] for ing in recipe["required_ingredients"]
+        )
+        recipe["ingredient_names"] = frozenset(ing["name"] for ing in recipe["ingredients"])
+        recipe["health_score"] = _health_score(recipe["nutrition"])
+        recipes_list.append(recipe)
+    recipes_map = {recipe["id"]: recipe for recipe in recipes_list}
+    return recipes_list, recipes_map
+
+
+def _recipe_card_fragments() -> Dict[int, Tuple[str, str]]:
+    return _recipe_card_fragments_for(recipes_version())
+
+
+@lru_cache(maxsize=1)
+def _recipe_card_fragments_for(version: int) -> Dict[int, Tuple[str, str]]:
+    """Render the user-independent head and meta row of every recipe card once."""
+    card_head = get_template_attribute("_recipe_card.html", "card_head")
+    card_meta = get_template_attribute("_recipe_card.html", "card_meta")
+    return {
+        recipe_id: (card_head(recipe), card_meta(recipe))
+        for recipe_id, recipe in _recipes_cache()[1].items()
+    }
+
+
+def _demo_cache_hasher():
+    # Non-adversarial cache key: BLAKE2b is faster than SHA-256 in software.
+    return hashlib.blake2b(digest_size=16)
+
+
+def _demo_cache_key(image_bytes: bytes) -> str:
+    hasher = _demo_cache_hasher()
+    hasher.update(image_bytes)
+    return hasher.hexdigest()
+
+
+def _read_upload(file) -> Tuple[str, io.BytesIO]:
+    """Read an upload in chunks, hashing each chunk while it is still hot."""
+    hasher = _demo_cache_hasher()
+    buffer = io.BytesIO()
+    while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+        hasher.update(chunk)
+        buffer.write(chunk)
+    return hasher.hexdigest(), buffer
+
+
+def _demo_cache_path(cache_key: str) -> Path:
     cache_dir = Path(app.root_path) / "static" / "demo_cache"
-    return cache_dir / f"{digest}.json"
+    return cache_dir / f"{cache_key}.json"
 
 
 def _sha256_digest(image_bytes: bytes) -> str:
     return hashlib.sha256(image_bytes).hexdigest()
 
 
-def _read_demo_cache(path: Path) -> Optional[List[Dict[str, object]]]:
-    if not path.exists():
-        return None
+@lru_cache(maxsize=DEMO_CACHE_MEMORY_SIZE)
+def _load_demo_cache(cache_key: str) -> List[Dict[str, object]]:
+    """Parse a demo cache file. Misses raise, so only hits are memoized."""
+    path = _demo_cache_path(cache_key)
     try:
-        payload = json.loads(path.read_text(encoding="utf-8"))
-    except (OSError, json.JSONDecodeError):
-        return None
+        payload = json_loads(path.read_bytes())
+    except (OSError, ValueError) as exc:
+        raise LookupError(cache_key) from exc
     ingredients = payload.get("ingredients")
-    if isinstance(ingredients, list):
-        return ingredients
-    return None
+    if not isinstance(ingredients, list):
+        raise LookupError(cache_key)
+    return ingredients
 
 
-def _write_demo_cache(path: Path, ingredients: List[Dict[str, object]]) -> None:
+def _read_demo_cache(cache_key: str) -> Optional[List[Dict[str, object]]]:
+    try:
+        return _load_demo_cache(cache_key)
+    except LookupError:
+        return None
+
+
+def _write_demo_cache(cache_key: str, ingredients: List[Dict[str, object]]) -> None:
+    path = _demo_cache_path(cache_key)
+    _load_demo_cache.cache_clear()
     try:
         path.parent.mkdir(parents=True, exist_ok=True)
         payload = {
             "ingredients": ingredients,
             "cached_at": datetime.now().isoformat(),
         }
-        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        path.write_bytes(json_dumps(payload))
     except OSError:
         return
 
@@ -170,14 +400,17 @@ def mobile_login_required(view):
 
 
 @app.context_processor
-def inject_alert_count():
-    """Inject alert count into all templates."""
+def inject_user():
+    return dict(user=current_user())
+
+
+@app.template_global()
+def alert_count() -> int:
+    """Expiry alert count, queried only by templates that display it."""
     user_id = session.get("user_id")
-    alert_count = 0
-    if user_id:
-        expiry_alerts = fetch_expiry_alerts(user_id)
-        alert_count = len(expiry_alerts)
-    return dict(alert_count=alert_count)
+    if not user_id:
+        return 0
+    return len(_get_expiry_alerts(user_id))
 
 
 @app.get("/")
@@ -192,38 +425,28 @@ def home():
 
     if user_id:
         # Get stats only if user is logged in
-        pantry_items = fetch_pantry_items(user_id)
+        pantry_items = _get_pantry_items(user_id)
         pantry_count = len(pantry_items)
 
-        expiry_alerts = fetch_expiry_alerts(user_id)
+        expiry_alerts = _get_expiry_alerts(user_id)
         expiry_alert_count = len(expiry_alerts)
 
-        recipes_data = fetch_recipes()
-        pantry_names = {item["name"] for item in pantry_items}
-        recipe_count = sum(1 for recipe in recipes_data
-                          if any(ing["name"] in pantry_names
-                                for ing in json.loads(recipe["ingredients_json"])))
+        recipes_data, _ = _recipes_cache()
+        pantry_names = _get_pantry_names(user_id)
+        recipe_count = sum(
+            1 for recipe in recipes_data if not pantry_names.isdisjoint(recipe["ingredient_names"])
+        )
 
         # Calculate average protein for the week
-        today = date.today()
-        last_7_days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
-        labels = [day.isoformat() for day in last_7_days]
-
-        logs = fetch_cooking_logs_range(user_id, labels[0], labels[-1])
-        recipes_map = {recipe["id"]: recipe for recipe in recipes_data}
+        _, labels = _last_7_days(date.today().toordinal())
 
-        total_protein = 0
-        for log in logs:
-            recipe = recipes_map.get(log["recipe_id"])
-            if recipe:
-                nutrition = json.loads(recipe["nutrition_json"])
-                total_protein += nutrition.get("protein", 0)
+        totals = fetch_daily_nutrition_totals(user_id, labels[0], labels[-1])
+        total_protein = sum(day["protein"] for day in totals)
 
         avg_protein = int(total_protein / 7) if total_protein > 0 else 0
 
     return render_template(
         "home.html",
-        user=current_user(),
         pantry_count=pantry_count,
         expiry_alert_count=expiry_alert_count,
         recipe_count=recipe_count,
@@ -247,8 +470,7 @@ def register():
     if get_user_by_username(username):
         return render_template("auth.html", error="ユーザー名は既に使われています")
 
-    password_hash = generate_password_hash(password, method="pbkdf2:sha256")
-    user_id = create_user(username, password_hash)
+    user_id = create_user(username, _hash_password(password))
     session["user_id"] = user_id
     return redirect(url_for("dashboard"))
 
@@ -259,7 +481,7 @@ def login():
     password = request.form.get("password", "").strip()
 
     user = get_user_by_username(username)
-    if not user or not check_password_hash(user["password_hash"], password):
+    if not user or not _verify_password(user, password):
         return render_template("auth.html", error="ログインに失敗しました")
 
     session["user_id"] = user["id"]
@@ -292,7 +514,7 @@ def mobile_login_post():
     password = request.form.get("password", "").strip()
 
     user = get_user_by_username(username)
-    if not user or not check_password_hash(user["password_hash"], password):
+    if not user or not _verify_password(user, password):
         return render_template("mobile/login.html", error="ログインに失敗しました")
 
     session["user_id"] = user["id"]
@@ -308,13 +530,13 @@ def mobile_logout():
 @app.get("/m/home")
 @mobile_login_required
 def mobile_home():
-    return render_template("mobile/scan.html", user=current_user())
+    return render_template("mobile/scan.html")
 
 
 @app.get("/m/scan")
 @mobile_login_required
 def mobile_scan():
-    return render_template("mobile/scan.html", user=current_user())
+    return render_template("mobile/scan.html")
 
 
 @app.get("/dashboard")
@@ -323,38 +545,20 @@ def dashboard():
     user_id = session["user_id"]
 
     # Get statistics
-    recognition_count = len(fetch_recognition_logs(user_id, limit=100))
+    recognition_count = fetch_recognition_log_count(user_id)
     recipe_count = fetch_cooking_log_count(user_id)
-    expiry_alerts = fetch_expiry_alerts(user_id)
+    expiry_alerts = _get_expiry_alerts(user_id)
 
     # Get recent logs
     recognition_logs = fetch_recognition_logs(user_id, limit=3)
 
     # Get recent cooked recipes
-    today = date.today()
-    last_7_days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
-    labels = [day.isoformat() for day in last_7_days]
-
-    cooking_logs = fetch_cooking_logs_range(user_id, labels[0], labels[-1])
-    recipes_map = {recipe["id"]: recipe for recipe in fetch_recipes()}
-
-    recent_recipes = []
-    seen_recipe_ids = set()
-    for log in sorted(cooking_logs, key=lambda x: x["cooked_at_date"], reverse=True):
-        recipe = recipes_map.get(log["recipe_id"])
-        if recipe and log["recipe_id"] not in seen_recipe_ids:
-            recent_recipes.append({
-                "id": recipe["id"],
-                "title": recipe["title"],
-                "cooked_at_date": log["cooked_at_date"],
-            })
-            seen_recipe_ids.add(log["recipe_id"])
-            if len(recent_recipes) >= 3:
-                break
+    _, labels = _last_7_days(date.today().toordinal())
+
+    recent_recipes = fetch_recent_cooked_recipes(user_id, labels[0], labels[-1], limit=3)
 
     return render_template(
         "dashboard.html",
-        user=current_user(),
         recognition_count=recognition_count,
         recipe_count=recipe_count,
         expiry_alert_count=len(expiry_alerts),
@@ -364,41 +568,23 @@ def dashboard():
 
 
 def _mock_recognize(filename: str) -> List[Dict[str, str]]:
-    pool = ["鶏むね肉", "卵", "ブロッコリー", "牛乳", "ご飯", "豆腐", "トマト", "玉ねぎ"]
-    matches = []
-    name = filename.lower()
-    keyword_map = {
-        "chicken": "鶏むね肉",
-        "egg": "卵",
-        "broccoli": "ブロッコリー",
-        "milk": "牛乳",
-        "rice": "ご飯",
-        "tofu": "豆腐",
-        "tomato": "トマト",
-        "onion": "玉ねぎ",
-    }
-    for key, value in keyword_map.items():
-        if key in name and value not in matches:
-            matches.append(value)
+    found = {match.group(1).lower() for match in _KEYWORD_PATTERN.finditer(filename)}
+    matches = [value for key, value in _KEYWORD_MAP.items() if key in found]
 
     if not matches:
-        matches = random.sample(pool, random.randint(3, 6))
+        matches = _MOCK_RNG.sample(_MOCK_POOL, _MOCK_RNG.randint(3, 6))
 
-    results = []
-    for item in matches:
-        results.append({
-            "name": item,
-            "quantity": random.randint(1, 3),
-            "unit": "個" if item in ["卵", "トマト"] else "枚" if item == "鶏むね肉" else "株" if item == "ブロッコリー" else "本" if item == "牛乳" else "杯" if item == "ご飯" else "丁" if item == "豆腐" else "個",
-        })
-    return results
+    return [
+        {"name": item, "quantity": _MOCK_RNG.randint(1, 3), "unit": _UNIT_MAP.get(item, "個")}
+        for item in matches
+    ]
 
 
 @app.get("/recognize")
 @login_required
 def recognize():
-    items = session.get("recognize_items", [])
-    return render_template("recognize.html", items=items, user=current_user())
+    items = get_recognize_items(session["user_id"])
+    return render_template("recognize.html", items=items)
 
 
 @app.post("/recognize")
@@ -409,58 +595,50 @@ def recognize_post():
         return redirect(url_for("recognize"))
 
     results = _mock_recognize(file.filename or "")
-    session["recognize_items"] = results
-    session.modified = True
+    set_recognize_items(session["user_id"], {uuid.uuid4().hex: item for item in results})
     return redirect(url_for("recognize"))
 
 
-@app.post("/recognize/update/<int:item_index>")
+@app.post("/recognize/update/<item_uid>")
 @login_required
-def recognize_update(item_index: int):
-    items = session.get("recognize_items", [])
-    if 0 <= item_index < len(items):
-        name = request.form.get("name", "").strip()
-        quantity = request.form.get("quantity", "1").strip()
-        unit = request.form.get("unit", "").strip()
-        if name and quantity.isdigit() and unit:
-            items[item_index] = {
+def recognize_update(item_uid: str):
+    name = request.form.get("name", "").strip()
+    quantity = request.form.get("quantity", "1").strip()
+    unit = request.form.get("unit", "").strip()
+    if item_uid.isalnum() and name and quantity.isdigit() and unit:
+        update_recognize_item(
+            session["user_id"],
+            item_uid,
+            {
                 "name": name,
                 "quantity": int(quantity),
                 "unit": unit,
-            }
-            session["recognize_items"] = items
-            session.modified = True
+            },
+        )
     return redirect(url_for("recognize"))
 
 
-@app.post("/recognize/delete/<int:item_index>")
+@app.post("/recognize/delete/<item_uid>")
 @login_required
-def recognize_delete(item_index: int):
-    items = session.get("recognize_items", [])
-    if 0 <= item_index < len(items):
-        items.pop(item_index)
-        session["recognize_items"] = items
-        session.modified = True
+def recognize_delete(item_uid: str):
+    if item_uid.isalnum():
+        delete_recognize_item(session["user_id"], item_uid)
     return redirect(url_for("recognize"))
 
 
 @app.post("/recognize/save")
 @login_required
 def recognize_save():
-    items = session.get("recognize_items", [])
     user_id = session["user_id"]
-    for item in items:
-        upsert_pantry_item(
-            user_id,
-            item["name"],
-            int(item["quantity"]),
-            item["unit"],
-            date.today().isoformat(),
-        )
+    items = get_recognize_items(user_id)
+    today_str = date.today().isoformat()
+    upsert_pantry_items(
+        user_id,
+        [(item["name"], int(item["quantity"]), item["unit"], today_str) for item in items],
+    )
     if items:
         add_recognition_log(user_id, datetime.now().isoformat(), len(items))
-    session["recognize_items"] = []
-    session.modified = True
+    clear_recognize_items(user_id)
     return redirect(url_for("pantry"))
 
 
@@ -468,9 +646,9 @@ def recognize_save():
 @login_required
 def pantry():
     user_id = session["user_id"]
-    items = fetch_pantry_items(user_id)
-    expiry_alerts = fetch_expiry_alerts(user_id)
-    return render_template("pantry.html", items=items, expiry_alert_count=len(expiry_alerts), user=current_user())
+    items = _get_pantry_items(user_id)
+    expiry_alerts = _get_expiry_alerts(user_id)
+    return render_template("pantry.html", items=items, expiry_alert_count=len(expiry_alerts))
 
 
 @app.post("/pantry/add")
@@ -496,7 +674,7 @@ def pantry_add():
 @login_required
 def vision():
     demo_catalog = _build_demo_catalog()
-    return render_template("vision.html", user=current_user(), demo_catalog=demo_catalog)
+    return render_template("vision.html", demo_catalog=demo_catalog)
 
 
 @app.post("/api/recognize")
@@ -511,8 +689,8 @@ def api_recognize():
         return jsonify({"ok": False, "error": "empty_image"}), 400
 
     digest = _sha256_digest(image_bytes)
-    cache_path = _demo_cache_path(image_bytes)
-    cached_ingredients = _read_demo_cache(cache_path)
+    cache_key = _demo_cache_key(image_bytes)
+    cached_ingredients = _read_demo_cache(cache_key)
     if cached_ingredients is not None:
         return jsonify(
             {
@@ -545,7 +723,7 @@ def api_recognize():
         return jsonify({"ok": False, "error": "unknown_error"}), 500
 
     if ingredients:
-        _write_demo_cache(cache_path, ingredients)
+        _write_demo_cache(cache_key, ingredients)
 
     return jsonify(
         {
@@ -563,20 +741,20 @@ def vision_ingredients():
     if not file:
         return jsonify({"error": "missing_image"}), 400
 
-    image_bytes = file.read()
-    if not image_bytes:
+    cache_key, buffer = _read_upload(file)
+    if not buffer.tell():
         return jsonify({"error": "empty_image"}), 400
 
     mime_type = file.mimetype or "image/jpeg"
     prefer_cache = request.headers.get("X-Demo-Image") == "1"
-    cache_path = _demo_cache_path(image_bytes)
-    cached_ingredients = _read_demo_cache(cache_path)
+    cached_ingredients = _read_demo_cache(cache_key)
 
     if prefer_cache and cached_ingredients is not None:
         response = jsonify({"ingredients": cached_ingredients})
         response.headers["X-Cache-Status"] = "Cached"
         return response
 
+    image_bytes = buffer.getvalue()
     try:
         ingredients = recognize_ingredients_from_bytes(image_bytes, mime_type)
     except MissingAPIKeyError as exc:
@@ -616,7 +794,7 @@ def vision_ingredients():
         return jsonify({"error": "unknown_error"}), 500
 
     if ingredients:
-        _write_demo_cache(cache_path, ingredients)
+        _write_demo_cache(cache_key, ingredients)
 
     response = jsonify({"ingredients": ingredients})
     response.headers["X-Cache-Status"] = "Live"
@@ -632,7 +810,7 @@ def vision_save():
         return jsonify({"error": "invalid_payload"}), 400
 
     user_id = session["user_id"]
-    saved = 0
+    rows = []
     today_str = date.today().isoformat()
     for item in items:
         if not isinstance(item, dict):
@@ -647,10 +825,10 @@ def vision_save():
             quantity = 1
         unit = str(item.get("unit", "個")).strip() or "個"
         expiry_date = str(item.get("expiry_date", "")).strip() or today_str
-        upsert_pantry_item(user_id, name, quantity, unit, expiry_date)
-        saved += 1
+        rows.append((name, quantity, unit, expiry_date))
 
-    return jsonify({"saved": saved})
+    upsert_pantry_items(user_id, rows)
+    return jsonify({"saved": len(rows)})
 
 
 @app.post("/pantry/update/<int:item_id>")
@@ -680,71 +858,69 @@ def pantry_delete(item_id: int):
     return redirect(url_for("pantry"))
 
 
+def _recipes_etag(user_id: int, pantry_names: frozenset) -> str:
+    """Everything the /recipes page depends on, hashed into one validator."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(
+        f"{RECIPES_VERSION}:{recipes_version()}:{user_id}:{date.today().isoformat()}:{alert_count()}:".encode("utf-8")
+    )
+    hasher.update(",".join(sorted(pantry_names)).encode("utf-8"))
+    return hasher.hexdigest()
+
+
 @app.get("/recipes")
 @login_required
 def recipes():
-    pantry_items = fetch_pantry_items(session["user_id"])
-    pantry_names = {item["name"] for item in pantry_items}
-    recipes_data = []
-    for recipe in fetch_recipes_with_ingredients():
-        ingredients = recipe.get("ingredients") or []
-        if not ingredients:
-            ingredients = json.loads(recipe["ingredients_json"])
+    user_id = session["user_id"]
+    pantry_names = _get_pantry_names(user_id)
+    etag = _recipes_etag(user_id, pantry_names)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
 
-        required = [ing for ing in ingredients if ing.get("role") == "required"]
-        if not required:
-            required = ingredients
-        required_names = {ing["name"] for ing in required}
-        matched_required = [ing for ing in required if ing["name"] in pantry_names]
+    scored = []
+    for recipe in _recipes_cache()[0]:
+        matched_names = pantry_names & recipe["required_names"]
 
-        total_required = max(1, len(required_names))
-        match_rate = len(matched_required) / total_required
-        missing_required = total_required - len(matched_required)
+        total_required = max(1, len(recipe["required_names"]))
+        match_rate = len(matched_names) / total_required
+        missing_required = total_required - len(matched_names)
 
         if match_rate < 0.6 and missing_required > 2:
             continue
 
-        nutrition = json.loads(recipe["nutrition_json"])
-        health_score = 0
-        if nutrition.get("protein", 0) >= 30:
-            health_score += 10
-        if nutrition.get("veg_score", 0) >= 2:
-            health_score += 10
-        if nutrition.get("kcal", 0) <= 500:
-            health_score += 10
-        if nutrition.get("fat", 0) <= 15:
-            health_score += 10
-        if nutrition.get("carb", 0) >= 70:
-            health_score -= 10
-        health_score = max(0, min(40, health_score))
-
         match_score = max(0, min(60, int(match_rate * 60) - missing_required * 8))
-        total_score = match_score + health_score
-
-        if total_score >= 85:
-            grade = "A"
-        elif total_score >= 70:
-            grade = "B"
-        elif total_score >= 55:
-            grade = "C"
-        else:
-            grade = "D"
+        scored.append(
+            (match_score + recipe["health_score"], match_rate, missing_required, matched_names, recipe)
+        )
 
+    # Only the top suggestions are rendered, so grade and build dicts for those alone.
+    card_fragments = _recipe_card_fragments()
+    recipes_data = []
+    for total_score, match_rate, missing_required, matched_names, recipe in heapq.nlargest(
+        RECIPE_SUGGESTION_LIMIT, scored, key=itemgetter(0)
+    ):
         recipes_data.append(
             {
                 **recipe,
-                "match_count": len(matched_required),
-                "match_items": matched_required,
+                "match_count": len(matched_names),
+                "match_items": [
+                    ing for ing in recipe["required_ingredients"] if ing["name"] in matched_names
+                ],
                 "match_rate": int(match_rate * 100),
                 "missing_required": missing_required,
-                "health_score": health_score,
                 "total_score": total_score,
-                "grade": grade,
+                "grade": _grade(total_score),
+                "card_head": card_fragments[recipe["id"]][0],
+                "card_meta": card_fragments[recipe["id"]][1],
             }
         )
-    recipes_data.sort(key=lambda r: r["total_score"], reverse=True)
-    recipes_data = recipes_data[:15]
-    return render_template("recipes.html", recipes=recipes_data, user=current_user())
+    response = app.response_class(stream_template("recipes.html", recipes=recipes_data))
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.get("/search")
@@ -755,49 +931,37 @@ def search():
 
     if query:
         results = search_recipes(query)
-        # 计算每个菜谱的匹配度（基于食材）
-        for recipe in results:
-            try:
-                ingredients = json.loads(recipe.get("ingredients_json", "[]"))
-                recipe["ingredients"] = ingredients
-            except (json.JSONDecodeError, TypeError):
-                recipe["ingredients"] = []
 
     return render_template(
         "search.html",
         query=query,
         results=results,
-        user=current_user(),
     )
 
 
 @app.get("/recipes/<int:recipe_id>")
 @login_required
 def recipe_detail(recipe_id: int):
-    recipe = fetch_recipe_by_id(recipe_id)
+    recipe = _recipes_cache()[1].get(recipe_id)
     if not recipe:
         return redirect(url_for("recipes"))
 
     # Calculate match rate with pantry items
     user_id = session["user_id"]
-    pantry_items = fetch_pantry_items(user_id)
-    pantry_names = {item["name"] for item in pantry_items}
-    ingredients = json.loads(recipe["ingredients_json"])
+    pantry_names = _get_pantry_names(user_id)
+    ingredients = recipe["ingredients"]
     matched_ingredients = [ing for ing in ingredients if ing["name"] in pantry_names]
     match_rate = int((len(matched_ingredients) / len(ingredients) * 100) if ingredients else 0)
 
-    nutrition_data = json.loads(recipe["nutrition_json"])
-
     return render_template(
         "recipe_detail.html",
         recipe=recipe,
         ingredients=ingredients,
-        steps=json.loads(recipe["steps_json"]),
-        nutrition=nutrition_data,
+        steps=recipe["steps"],
+        nutrition=recipe["nutrition"],
         match_rate=match_rate,
         matched_count=len(matched_ingredients),
         total_ingredients=len(ingredients),
-        user=current_user(),
     )
 
 
@@ -808,96 +972,63 @@ def recipe_cook(recipe_id: int):
     return redirect(url_for("recipe_detail", recipe_id=recipe_id))
 
 
+# bisect_right lookup tables. Upper bounds that are inclusive (2400, 2600)
+# are nudged to the next float so the value itself stays in the lower bin.
+_KCAL_BINS = (1400, 1600, math.nextafter(2400, math.inf), math.nextafter(2600, math.inf))
+_KCAL_DELTAS = (-5, 0, 20, 0, -5)
+_KCAL_REASON_BINS = (1400, math.nextafter(2600, math.inf))
+_KCAL_REASONS = ("カロリーが少なめです", "カロリーは適正範囲です", "カロリーが高めです")
+_PROTEIN_BINS = (40, 60)
+_PROTEIN_DELTAS = (-5, 10, 20)
+_PROTEIN_REASONS = ("たんぱく質が不足気味です", "たんぱく質が十分です", "たんぱく質が十分です")
+_VEG_BINS = (2,)
+_VEG_DELTAS = (0, 10)
+_VEG_REASONS = ("野菜スコアを上げましょう", "野菜摂取は良好です")
+_GRADE_BINS = (55, 70, 85)
+_GRADES = ("D", "C", "B", "A")
+
+
+def _grade(score: float) -> str:
+    return _GRADES[bisect.bisect_right(_GRADE_BINS, score)]
+
+
 def _nutrition_score(today_totals: Dict[str, float]) -> Dict[str, str]:
     total_kcal = today_totals.get("kcal", 0)
     protein = today_totals.get("protein", 0)
     veg_score = today_totals.get("veg_score", 0)
 
-    score = 50
+    protein_bin = bisect.bisect_right(_PROTEIN_BINS, protein)
+    veg_bin = bisect.bisect_right(_VEG_BINS, veg_score)
+
     if total_kcal == 0:
         score = 20
-    elif 1600 <= total_kcal <= 2400:
-        score += 20
-    elif total_kcal < 1400 or total_kcal > 2600:
-        score -= 5
-
-    if protein >= 60:
-        score += 20
-    elif protein >= 40:
-        score += 10
+        kcal_reason = "本日の食事記録がありません"
     else:
-        score -= 5
-
-    if veg_score >= 2:
-        score += 10
-
+        score = 50 + _KCAL_DELTAS[bisect.bisect_right(_KCAL_BINS, total_kcal)]
+        kcal_reason = _KCAL_REASONS[bisect.bisect_right(_KCAL_REASON_BINS, total_kcal)]
+    score += _PROTEIN_DELTAS[protein_bin] + _VEG_DELTAS[veg_bin]
     score = max(0, min(100, int(score)))
 
-    if score >= 85:
-        grade = "A"
-    elif score >= 70:
-        grade = "B"
-    elif score >= 55:
-        grade = "C"
-    else:
-        grade = "D"
-
-    reasons = []
-    if total_kcal == 0:
-        reasons.append("本日の食事記録がありません")
-    elif total_kcal < 1400:
-        reasons.append("カロリーが少なめです")
-    elif total_kcal > 2600:
-        reasons.append("カロリーが高めです")
-    else:
-        reasons.append("カロリーは適正範囲です")
-
-    if protein < 40:
-        reasons.append("たんぱく質が不足気味です")
-    else:
-        reasons.append("たんぱく質が十分です")
-
-    if veg_score < 2:
-        reasons.append("野菜スコアを上げましょう")
-    else:
-        reasons.append("野菜摂取は良好です")
-
-    return {"score": score, "grade": grade, "reasons": reasons[:3]}
+    reasons = [kcal_reason, _PROTEIN_REASONS[protein_bin], _VEG_REASONS[veg_bin]]
+    return {"score": score, "grade": _grade(score), "reasons": reasons}
 
 
 @app.get("/nutrition")
 @login_required
 def nutrition():
-    recipes_map = {recipe["id"]: recipe for recipe in fetch_recipes()}
-
-    today = date.today()
-    last_7_days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
-    labels = [day.isoformat() for day in last_7_days]
+    _, labels = _last_7_days(date.today().toordinal())
 
-    daily_totals = {label: {"kcal": 0, "protein": 0} for label in labels}
-    today_totals = {"kcal": 0, "protein": 0, "veg_score": 0}
-
-    logs = fetch_cooking_logs_range(
-        session["user_id"], labels[0], labels[-1]
-    )
-
-    for log in logs:
-        recipe = recipes_map.get(log["recipe_id"])
-        if not recipe:
-            continue
-        nutrition = json.loads(recipe["nutrition_json"])
-        day_key = log["cooked_at_date"]
-        if day_key in daily_totals:
-            daily_totals[day_key]["kcal"] += nutrition.get("kcal", 0)
-            daily_totals[day_key]["protein"] += nutrition.get("protein", 0)
-        if day_key == today.isoformat():
-            today_totals["kcal"] += nutrition.get("kcal", 0)
-            today_totals["protein"] += nutrition.get("protein", 0)
-            today_totals["veg_score"] += nutrition.get("veg_score", 0)
+    daily_totals = {
+        day["cooked_at_date"]: day
+        for day in fetch_daily_nutrition_totals(session["user_id"], labels[0], labels[-1])
+    }
+    empty_day = dict.fromkeys(("kcal", "protein", "veg_score"), 0)
+    today_row = daily_totals.get(labels[-1], empty_day)
+    today_totals = {key: today_row[key] for key in empty_day}
 
     score_data = _nutrition_score(today_totals)
-    kcal_series = [daily_totals[label]["kcal"] for label in labels]
-    protein_series = [daily_totals[label]["protein"] for label in labels]
+    kcal_series = [daily_totals.get(label, empty_day)["kcal"] for label in labels]
+    protein_series = [daily_totals.get(label, empty_day)["protein"] for label in labels]
 
     alerts = []
     if today_totals["protein"] < 40:
@@ -907,8 +1038,7 @@ def nutrition():
     if not alerts:
         alerts.append("栄養バランスは良好です")
 
-    pantry_items = fetch_pantry_items(session["user_id"])
-    pantry_names = {item["name"] for item in pantry_items}
+    pantry_names = _get_pantry_names(session["user_id"])
     shopping_list = []
     if today_totals["protein"] < 40:
         for item in ["鶏むね肉", "豆腐", "牛乳"]:
@@ -921,9 +1051,8 @@ def nutrition():
     if not shopping_list:
         shopping_list = ["牛乳", "卵"]
 
-    return render_template(
+    return stream_template(
         "nutrition.html",
-        user=current_user(),
         score_data=score_data,
         labels=labels,
         kcal_series=kcal_series,
@@ -938,14 +1067,14 @@ def nutrition():
 @login_required
 def notifications():
     user_id = session["user_id"]
-    expiry_alerts = fetch_expiry_alerts(user_id)
+    expiry_alerts = _get_expiry_alerts(user_id)
     return render_template(
         "notifications.html",
-        user=current_user(),
         alerts=expiry_alerts,
-        alert_count=len(expiry_alerts),
     )
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development server only; debug mode follows FLASK_DEBUG. Use wsgi.py with
+    # gunicorn_conf.py in production.
+    app.run()
@@ -1,349 +1,563 @@
 # -*- coding: utf-8 -*-
-import json
+import atexit
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-from recipes_data import INTERNATIONAL_RECIPES
-
-DB_PATH = Path(__file__).with_name("db.sqlite3")
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from jsonutil import dumps as json_dumps, loads as json_loads
+
+DB_PATH = str(Path(__file__).with_name("db.sqlite3"))
+
+RECIPE_JSON_COLUMNS = (
+    ("steps_json", "steps"),
+    ("ingredients_json", "ingredients"),
+    ("nutrition_json", "nutrition"),
+)
+# Nutrition values denormalized from nutrition_json so they can be summed in SQL.
+RECIPE_NUTRITION_COLUMNS = ("kcal", "protein", "veg_score")
+# Bound-parameter limit of SQLite >= 3.32; multi-row VALUES inserts stay under it.
+SQLITE_MAX_VARIABLES = 32766
+
+# SQL for the queries that run on most page loads.
+_SQL_GET_USER_BY_ID = "SELECT id, username FROM users WHERE id = ?"
+_SQL_FETCH_PANTRY = """
+    SELECT id, name, quantity, unit, expiry_date
+    FROM pantry_items
+    WHERE user_id = ?
+    ORDER BY id DESC
+"""
+_SQL_GET_RECOGNIZE_ITEMS = "SELECT items_json FROM recognize_session WHERE user_id = ?"
+_SQL_FETCH_RECENT_COOKED_RECIPES = """
+    SELECT r.id, r.title, MAX(c.cooked_at_date) AS cooked_at_date
+    FROM cooking_log c
+    JOIN recipes r ON r.id = c.recipe_id
+    WHERE c.user_id = ? AND c.cooked_at_date BETWEEN ? AND ?
+    GROUP BY c.recipe_id
+    ORDER BY cooked_at_date DESC, MAX(c.id) DESC
+    LIMIT ?
+"""
+_SQL_FETCH_DAILY_NUTRITION_TOTALS = """
+    SELECT c.cooked_at_date,
+           SUM(r.kcal) AS kcal,
+           SUM(r.protein) AS protein,
+           SUM(r.veg_score) AS veg_score
+    FROM cooking_log c
+    JOIN recipes r ON r.id = c.recipe_id
+    WHERE c.user_id = ? AND c.cooked_at_date BETWEEN ? AND ?
+    GROUP BY c.cooked_at_date
+    ORDER BY c.cooked_at_date ASC
+"""
+_SQL_FETCH_RECOGNITION_LOGS = """
+    SELECT id, user_id, recognized_at, items_count
+    FROM recognition_logs
+    WHERE user_id = ?
+    ORDER BY recognized_at DESC
+    LIMIT ?
+"""
+_SQL_COUNT_RECOGNITION_LOGS = "SELECT COUNT(*) AS count FROM recognition_logs WHERE user_id = ?"
+_SQL_FETCH_EXPIRY_ALERTS = """
+    SELECT id, name, quantity, unit, expiry_date
+    FROM pantry_items
+    WHERE user_id = ? AND expiry_date IS NOT NULL AND expiry_date <= date('now', '+7 days')
+    ORDER BY expiry_date ASC
+"""
+_SQL_COUNT_COOKED_RECIPES = "SELECT COUNT(DISTINCT recipe_id) as count FROM cooking_log WHERE user_id = ?"
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+# WAL is persisted in the database header, so it only needs setting once per file.
+_wal_enabled_paths = set()
+
+# Bumped whenever seed_data() adds recipes; see recipes_version().
+_recipes_version = 0
+# Set by init_db(); False until then or when FTS5 trigram search is unavailable.
+_fts_enabled = False
+
+
+def _reset_local() -> None:
+    # A forked worker must not reuse the parent's SQLite handle.
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_local)
+
+
+@atexit.register
+def _close_local() -> None:
+    # Only the exiting thread's handle can be closed here; sqlite3 refuses
+    # cross-thread close, and worker threads' handles die with the process.
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
 
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Return this thread's shared connection, opening it on first use.
+
+    ``with get_connection() as conn`` still commits or rolls back the
+    transaction; it does not close the connection.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        if DB_PATH != ":memory:":
+            if DB_PATH not in _wal_enabled_paths:
+                conn.execute("PRAGMA journal_mode=WAL")
+                _wal_enabled_paths.add(DB_PATH)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+        _local.conn = conn
     return conn
 
 
+def _decode_recipe(row: sqlite3.Row) -> Dict[str, Any]:
+    """Return a recipe dict with its JSON columns decoded."""
+    recipe = dict(row)
+    for column, key in RECIPE_JSON_COLUMNS:
+        if column in recipe:
+            recipe[key] = json_loads(recipe.pop(column))
+    return recipe
+
+
+# Idempotent DDL, run as one script (and one transaction) by init_db().
+SCHEMA_SQL = """
+BEGIN;
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS pantry_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit TEXT NOT NULL,
+        expiry_date TEXT,
+        UNIQUE(user_id, name)
+    );
+    CREATE TABLE IF NOT EXISTS recipes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        steps_json TEXT NOT NULL,
+        ingredients_json TEXT NOT NULL,
+        nutrition_json TEXT NOT NULL,
+        kcal NUMERIC NOT NULL DEFAULT 0,
+        protein NUMERIC NOT NULL DEFAULT 0,
+        veg_score NUMERIC NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS recognize_session (
+        user_id INTEGER PRIMARY KEY,
+        items_json TEXT NOT NULL DEFAULT '{}',
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    CREATE TABLE IF NOT EXISTS ingredients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name_canonical TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS recipe_ingredients (
+        recipe_id INTEGER NOT NULL,
+        ingredient_id INTEGER NOT NULL,
+        amount REAL,
+        unit TEXT,
+        role TEXT NOT NULL,
+        PRIMARY KEY (recipe_id, ingredient_id, role),
+        FOREIGN KEY (recipe_id) REFERENCES recipes(id),
+        FOREIGN KEY (ingredient_id) REFERENCES ingredients(id)
+    );
+    CREATE TABLE IF NOT EXISTS ingredient_alias (
+        alias TEXT PRIMARY KEY,
+        ingredient_id INTEGER NOT NULL,
+        FOREIGN KEY (ingredient_id) REFERENCES ingredients(id)
+    );
+    CREATE TABLE IF NOT EXISTS cooking_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        recipe_id INTEGER NOT NULL,
+        cooked_at_date TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cooking_user_date
+    ON cooking_log (user_id, cooked_at_date);
+    CREATE INDEX IF NOT EXISTS idx_cooking_user_recipe
+    ON cooking_log (user_id, recipe_id);
+    CREATE TABLE IF NOT EXISTS recognition_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        recognized_at TEXT NOT NULL,
+        items_count INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_pantry_user_expiry
+    ON pantry_items (user_id, expiry_date);
+    CREATE INDEX IF NOT EXISTS idx_recog_user_time
+    ON recognition_logs (user_id, recognized_at DESC);
+COMMIT;
+"""
+
+
 def init_db() -> None:
+    global _fts_enabled
     with get_connection() as conn:
+        conn.executescript(SCHEMA_SQL)
+        _add_recipe_nutrition_columns(conn)
+        _fts_enabled = _create_recipes_fts(conn)
+        # Items used to be stored as a JSON array; they are keyed by uid now.
+        conn.execute("DELETE FROM recognize_session WHERE json_type(items_json) != 'object'")
+        conn.commit()
+
+
+# The trigram tokenizer indexes every 3-character window, which gives
+# substring search for Japanese text that has no word boundaries.
+FTS_MIN_QUERY_LENGTH = 3
+
+
+def _create_recipes_fts(conn: sqlite3.Connection) -> bool:
+    """Full-text index over recipe titles/descriptions, kept in sync by triggers.
+
+    Returns False when this SQLite build has no FTS5 trigram tokenizer
+    (it needs SQLite 3.34+); search_recipes() then keeps to the LIKE scan.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recipes_fts'"
+    ).fetchone()
+    try:
         conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS pantry_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit TEXT NOT NULL,
-                expiry_date TEXT,
-                UNIQUE(user_id, name)
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS recipes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                steps_json TEXT NOT NULL,
-                ingredients_json TEXT NOT NULL,
-                nutrition_json TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ingredients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name_canonical TEXT NOT NULL UNIQUE
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS recipe_ingredients (
-                recipe_id INTEGER NOT NULL,
-                ingredient_id INTEGER NOT NULL,
-                amount REAL,
-                unit TEXT,
-                role TEXT NOT NULL,
-                PRIMARY KEY (recipe_id, ingredient_id, role),
-                FOREIGN KEY (recipe_id) REFERENCES recipes(id),
-                FOREIGN KEY (ingredient_id) REFERENCES ingredients(id)
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ingredient_alias (
-                alias TEXT PRIMARY KEY,
-                ingredient_id INTEGER NOT NULL,
-                FOREIGN KEY (ingredient_id) REFERENCES ingredients(id)
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cooking_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                recipe_id INTEGER NOT NULL,
-                cooked_at_date TEXT NOT NULL
+            CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+                title, description, content='recipes', content_rowid='id', tokenize='trigram'
             )
             """
         )
+    except sqlite3.OperationalError:
+        return False
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON recipes BEGIN
+            INSERT INTO recipes_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON recipes BEGIN
+            INSERT INTO recipes_fts (recipes_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_au AFTER UPDATE OF title, description ON recipes
+        BEGIN
+            INSERT INTO recipes_fts (recipes_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO recipes_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """
+    )
+    if not exists:
+        # Index recipes seeded before the FTS table existed.
+        conn.execute("INSERT INTO recipes_fts (recipes_fts) VALUES ('rebuild')")
+    return True
+
+
+def _add_recipe_nutrition_columns(conn: sqlite3.Connection) -> None:
+    """Add and backfill the nutrition columns on databases created before them."""
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(recipes)")}
+    for column in RECIPE_NUTRITION_COLUMNS:
+        if column in existing:
+            continue
+        conn.execute(f"ALTER TABLE recipes ADD COLUMN {column} NUMERIC NOT NULL DEFAULT 0")
         conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS recognition_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                recognized_at TEXT NOT NULL,
-                items_count INTEGER NOT NULL
-            )
-            """
+            f"UPDATE recipes SET {column} = COALESCE(json_extract(nutrition_json, '$.{column}'), 0)"
         )
-        conn.commit()
 
 
-def seed_data() -> None:
-    with get_connection() as conn:
-        demo_user = conn.execute(
-            "SELECT id FROM users WHERE username = ?",
-            ("demo",),
-        ).fetchone()
-        if demo_user is None:
-            conn.execute(
-                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                (
-                    "demo",
-                    "pbkdf2:sha256:1000000$0nVv9qO3JP71ILXS$401974b385d6b086d4dc74fa1ae28894a0341ee9b5517b809c73cad21da2d344",
-                ),
-            )
-            demo_user_id = conn.execute(
-                "SELECT id FROM users WHERE username = ?",
-                ("demo",),
-            ).fetchone()["id"]
-        else:
-            demo_user_id = demo_user["id"]
-            conn.execute(
-                "UPDATE users SET password_hash = ? WHERE id = ?",
-                (
-                    "pbkdf2:sha256:1000000$0nVv9qO3JP71ILXS$401974b385d6b086d4dc74fa1ae28894a0341ee9b5517b809c73cad21da2d344",
-                    demo_user_id,
-                ),
-            )
+def _values_placeholders(row_count: int, width: int) -> str:
+    """``(?, ?), (?, ?)``-style VALUES list for a multi-row INSERT."""
+    row = "(" + ", ".join("?" * width) + ")"
+    return ", ".join([row] * row_count)
 
-        new_user = conn.execute(
-            "SELECT id FROM users WHERE username = ?",
-            ("newone",),
-        ).fetchone()
-        if new_user is None:
-            conn.execute(
-                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                (
-                    "newone",
-                    "pbkdf2:sha256:1000000$lLhtdkq6Pt8yXZyN$de7590a562dad6787e3516dc5dfa14446f748643e9e9f067b77f51d80c071968",
-                ),
-            )
-        else:
-            conn.execute(
-                "UPDATE users SET password_hash = ? WHERE id = ?",
-                (
-                    "pbkdf2:sha256:1000000$lLhtdkq6Pt8yXZyN$de7590a562dad6787e3516dc5dfa14446f748643e9e9f067b77f51d80c071968",
-                    new_user["id"],
-                ),
-            )
+
+@contextmanager
+def _synchronous_off(conn: sqlite3.Connection) -> Iterator[None]:
+    """Skip fsyncs for a rerunnable bulk load, restoring NORMAL afterwards."""
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        yield
+    finally:
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def seed_data() -> None:
+    # Only seeding needs the bundled recipe data.
+    from recipes_data import INTERNATIONAL_RECIPES
+
+    global _recipes_version
+    inserted_recipes = False
+    conn = get_connection()
+    # The connection block must exit (commit) before synchronous is restored.
+    with _synchronous_off(conn), conn:
+        # One write transaction for the whole seed: a single fsync at commit,
+        # and no other writer can slip in between the reads and the inserts.
+        conn.execute("BEGIN IMMEDIATE")
+        now = datetime.now()
+        # Re-seeding resets the demo accounts' passwords. Update first: a
+        # conflicting INSERT would still burn an AUTOINCREMENT value each start.
+        seed_user_ids = {}
+        for username, password_hash in (
+            (
+                "demo",
+                "pbkdf2:sha256:1000000$0nVv9qO3JP71ILXS$401974b385d6b086d4dc74fa1ae28894a0341ee9b5517b809c73cad21da2d344",
+            ),
+            (
+                "newone",
+                "pbkdf2:sha256:1000000$lLhtdkq6Pt8yXZyN$de7590a562dad6787e3516dc5dfa14446f748643e9e9f067b77f51d80c071968",
+            ),
+        ):
+            row = conn.execute(
+                "UPDATE users SET password_hash = ? WHERE username = ? RETURNING id",
+                (password_hash, username),
+            ).fetchone()
+            if row is None:
+                row = conn.execute(
+                    "INSERT INTO users (username, password_hash) VALUES (?, ?) RETURNING id",
+                    (username, password_hash),
+                ).fetchone()
+            seed_user_ids[username] = row["id"]
+        demo_user_id = seed_user_ids["demo"]
 
         pantry_seed = [
             # 易失商品 (1-3天内过期)
-            ("鸡蛋", 2, "个", (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d")),
-            ("牛奶", 1, "盒", (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")),
-            ("豆腐", 2, "块", (datetime.now() + timedelta(days=4)).strftime("%Y-%m-%d")),
-            ("番茄", 8, "个", (datetime.now() + timedelta(days=5)).strftime("%Y-%m-%d")),
-            ("牛肉", 1, "斤", (datetime.now() + timedelta(days=6)).strftime("%Y-%m-%d")),
+            ("鸡蛋", 2, "个", (now + timedelta(days=2)).strftime("%Y-%m-%d")),
+            ("牛奶", 1, "盒", (now + timedelta(days=3)).strftime("%Y-%m-%d")),
+            ("豆腐", 2, "块", (now + timedelta(days=4)).strftime("%Y-%m-%d")),
+            ("番茄", 8, "个", (now + timedelta(days=5)).strftime("%Y-%m-%d")),
+            ("牛肉", 1, "斤", (now + timedelta(days=6)).strftime("%Y-%m-%d")),
             # 中期食材 (7-15天)
-            ("菠菜", 3, "把", (datetime.now() + timedelta(days=15)).strftime("%Y-%m-%d")),
-            ("胡萝卜", 3, "个", (datetime.now() + timedelta(days=8)).strftime("%Y-%m-%d")),
-            ("土豆", 2, "个", (datetime.now() + timedelta(days=12)).strftime("%Y-%m-%d")),
-            ("洋葱", 5, "个", (datetime.now() + timedelta(days=20)).strftime("%Y-%m-%d")),
-            ("葱", 3, "斤", (datetime.now() + timedelta(days=18)).strftime("%Y-%m-%d")),
+            ("菠菜", 3, "把", (now + timedelta(days=15)).strftime("%Y-%m-%d")),
+            ("胡萝卜", 3, "个", (now + timedelta(days=8)).strftime("%Y-%m-%d")),
+            ("土豆", 2, "个", (now + timedelta(days=12)).strftime("%Y-%m-%d")),
+            ("洋葱", 5, "个", (now + timedelta(days=20)).strftime("%Y-%m-%d")),
+            ("葱", 3, "斤", (now + timedelta(days=18)).strftime("%Y-%m-%d")),
             # 长期食材
-            ("盐", 1, "袋", (datetime.now() + timedelta(days=180)).strftime("%Y-%m-%d")),
-            ("油", 1, "斤", (datetime.now() + timedelta(days=60)).strftime("%Y-%m-%d")),
-            ("酱油", 1, "斤", (datetime.now() + timedelta(days=90)).strftime("%Y-%m-%d")),
-            ("砂糖", 1, "袋", (datetime.now() + timedelta(days=120)).strftime("%Y-%m-%d")),
-            ("小麦粉", 1, "袋", (datetime.now() + timedelta(days=100)).strftime("%Y-%m-%d")),
+            ("盐", 1, "袋", (now + timedelta(days=180)).strftime("%Y-%m-%d")),
+            ("油", 1, "斤", (now + timedelta(days=60)).strftime("%Y-%m-%d")),
+            ("酱油", 1, "斤", (now + timedelta(days=90)).strftime("%Y-%m-%d")),
+            ("砂糖", 1, "袋", (now + timedelta(days=120)).strftime("%Y-%m-%d")),
+            ("小麦粉", 1, "袋", (now + timedelta(days=100)).strftime("%Y-%m-%d")),
             # 冷冻食品
-            ("冷冻鸡腿", 2, "袋", (datetime.now() + timedelta(days=45)).strftime("%Y-%m-%d")),
-            ("冷冻饺子", 1, "盒", (datetime.now() + timedelta(days=40)).strftime("%Y-%m-%d")),
+            ("冷冻鸡腿", 2, "袋", (now + timedelta(days=45)).strftime("%Y-%m-%d")),
+            ("冷冻饺子", 1, "盒", (now + timedelta(days=40)).strftime("%Y-%m-%d")),
             # 饮料和其他
-            ("番茄酱", 1, "袋", (datetime.now() + timedelta(days=60)).strftime("%Y-%m-%d")),
-            ("面条", 3, "个", (datetime.now() + timedelta(days=9)).strftime("%Y-%m-%d")),
-            ("大米", 1, "袋", (datetime.now() + timedelta(days=25)).strftime("%Y-%m-%d")),
+            ("番茄酱", 1, "袋", (now + timedelta(days=60)).strftime("%Y-%m-%d")),
+            ("面条", 3, "个", (now + timedelta(days=9)).strftime("%Y-%m-%d")),
+            ("大米", 1, "袋", (now + timedelta(days=25)).strftime("%Y-%m-%d")),
         ]
-        for name, qty, unit, expiry_date in pantry_seed:
+        has_pantry = conn.execute(
+            "SELECT 1 FROM pantry_items WHERE user_id = ? LIMIT 1",
+            (demo_user_id,),
+        ).fetchone()
+        # On a first seed the names cannot collide, so skip the conflict clause.
+        conflict_sql = ""
+        if has_pantry:
+            conflict_sql = """
+            ON CONFLICT(user_id, name)
+            DO UPDATE SET expiry_date = excluded.expiry_date
+            """
+        pantry_rows_per_statement = SQLITE_MAX_VARIABLES // 5
+        for offset in range(0, len(pantry_seed), pantry_rows_per_statement):
+            chunk = pantry_seed[offset:offset + pantry_rows_per_statement]
             conn.execute(
+                "INSERT INTO pantry_items (user_id, name, quantity, unit, expiry_date) VALUES "
+                + _values_placeholders(len(chunk), 5)
+                + conflict_sql,
+                [value for row in chunk for value in (demo_user_id, *row)],
+            )
+
+        ingredient_ids = dict(conn.execute("SELECT name_canonical, id FROM ingredients"))
+
+        existing_titles = {row["title"] for row in conn.execute("SELECT title FROM recipes")}
+
+        new_recipes = []
+        for recipe in INTERNATIONAL_RECIPES:
+            if recipe["title"] in existing_titles:
+                continue
+            existing_titles.add(recipe["title"])
+            new_recipes.append(recipe)
+
+        if new_recipes:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM recipes").fetchone()[0]
+            conn.executemany(
                 """
-                INSERT INTO pantry_items (user_id, name, quantity, unit, expiry_date)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(user_id, name)
-                DO UPDATE SET expiry_date = excluded.expiry_date
+                INSERT INTO recipes
+                    (title, description, steps_json, ingredients_json, nutrition_json,
+                     kcal, protein, veg_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (demo_user_id, name, qty, unit, expiry_date),
+                [
+                    (
+                        recipe["title"],
+                        recipe["description"],
+                        json_dumps(recipe["steps"]).decode(),
+                        json_dumps(recipe["ingredients"]).decode(),
+                        json_dumps(recipe["nutrition"]).decode(),
+                        *(recipe["nutrition"].get(column, 0) for column in RECIPE_NUTRITION_COLUMNS),
+                    )
+                    for recipe in new_recipes
+                ],
+            )
+            recipe_ids = dict(
+                conn.execute("SELECT title, id FROM recipes WHERE id > ?", (last_id,))
             )
 
-        def _insert_recipe(conn, recipe):
-            existing = conn.execute(
-                "SELECT id FROM recipes WHERE title = ?",
-                (recipe["title"],),
-            ).fetchone()
-            if existing:
-                return
-            cursor = conn.execute(
+            # The recipes are new, so the only possible key clash is a repeated
+            # ingredient within one recipe; keep the first one like OR IGNORE did.
+            links: Dict[Tuple[int, int, str], Tuple[Any, ...]] = {}
+            for recipe in new_recipes:
+                recipe_id = recipe_ids[recipe["title"]]
+                for idx, ing in enumerate(recipe["ingredients"]):
+                    ing_name = str(ing.get("name", "")).strip()
+                    if not ing_name:
+                        continue
+                    ing_id = _get_or_create_ingredient_id(conn, ing_name, ingredient_ids)
+                    role = "required" if idx < 2 else "optional"
+                    links.setdefault(
+                        (recipe_id, ing_id, role),
+                        (recipe_id, ing_id, ing.get("quantity"), ing.get("unit"), role),
+                    )
+            conn.executemany(
                 """
-                INSERT INTO recipes
-                    (title, description, steps_json, ingredients_json, nutrition_json)
+                INSERT INTO recipe_ingredients
+                    (recipe_id, ingredient_id, amount, unit, role)
                 VALUES (?, ?, ?, ?, ?)
                 """,
-                (
-                    recipe["title"],
-                    recipe["description"],
-                    json.dumps(recipe["steps"], ensure_ascii=False),
-                    json.dumps(recipe["ingredients"], ensure_ascii=False),
-                    json.dumps(recipe["nutrition"], ensure_ascii=False),
-                ),
+                links.values(),
             )
-            recipe_id = cursor.lastrowid
-            for idx, ing in enumerate(recipe["ingredients"]):
-                ing_name = str(ing.get("name", "")).strip()
-                if not ing_name:
-                    continue
-                ing_id = _get_or_create_ingredient_id(conn, ing_name)
-                role = "required" if idx < 2 else "optional"
-                conn.execute(
-                    """
-                    INSERT OR IGNORE INTO recipe_ingredients
-                        (recipe_id, ingredient_id, amount, unit, role)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        recipe_id,
-                        ing_id,
-                        ing.get("quantity"),
-                        ing.get("unit"),
-                        role,
-                    ),
-                )
-
-        global_recipes = INTERNATIONAL_RECIPES
-        for recipe in global_recipes:
-            _insert_recipe(conn, recipe)
+            inserted_recipes = True
 
         # Add cooking history (demonstration data)
         cooking_history = [
-            (demo_user_id, 1, (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d")),
-            (demo_user_id, 2, (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d")),
-            (demo_user_id, 3, (datetime.now() - timedelta(days=4)).strftime("%Y-%m-%d")),
-            (demo_user_id, 1, (datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d")),
-            (demo_user_id, 4, (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")),
-            (demo_user_id, 2, (datetime.now()).strftime("%Y-%m-%d")),
-            (demo_user_id, 3, (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")),
-            (demo_user_id, 1, (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")),
+            (demo_user_id, 1, (now - timedelta(days=5)).strftime("%Y-%m-%d")),
+            (demo_user_id, 2, (now - timedelta(days=3)).strftime("%Y-%m-%d")),
+            (demo_user_id, 3, (now - timedelta(days=4)).strftime("%Y-%m-%d")),
+            (demo_user_id, 1, (now - timedelta(days=2)).strftime("%Y-%m-%d")),
+            (demo_user_id, 4, (now - timedelta(days=1)).strftime("%Y-%m-%d")),
+            (demo_user_id, 2, now.strftime("%Y-%m-%d")),
+            (demo_user_id, 3, (now - timedelta(days=6)).strftime("%Y-%m-%d")),
+            (demo_user_id, 1, (now - timedelta(days=7)).strftime("%Y-%m-%d")),
         ]
-        for user_id, recipe_id, cooked_date in cooking_history:
-            conn.execute(
-                "INSERT INTO cooking_log (user_id, recipe_id, cooked_at_date) VALUES (?, ?, ?)",
-                (user_id, recipe_id, cooked_date),
-            )
+        conn.execute(
+            "INSERT INTO cooking_log (user_id, recipe_id, cooked_at_date) VALUES "
+            + _values_placeholders(len(cooking_history), 3),
+            [value for row in cooking_history for value in row],
+        )
 
         # Add AI recognition history
         recognition_history = [
-            (demo_user_id, (datetime.now() - timedelta(days=8)).isoformat(), 3),
-            (demo_user_id, (datetime.now() - timedelta(days=6)).isoformat(), 2),
-            (demo_user_id, (datetime.now() - timedelta(days=4)).isoformat(), 5),
-            (demo_user_id, (datetime.now() - timedelta(days=2)).isoformat(), 4),
-            (demo_user_id, (datetime.now() - timedelta(days=1)).isoformat(), 6),
-            (demo_user_id, (datetime.now()).isoformat(), 2),
+            (demo_user_id, (now - timedelta(days=8)).isoformat(), 3),
+            (demo_user_id, (now - timedelta(days=6)).isoformat(), 2),
+            (demo_user_id, (now - timedelta(days=4)).isoformat(), 5),
+            (demo_user_id, (now - timedelta(days=2)).isoformat(), 4),
+            (demo_user_id, (now - timedelta(days=1)).isoformat(), 6),
+            (demo_user_id, now.isoformat(), 2),
         ]
-        for user_id, recognized_at, items_count in recognition_history:
-            conn.execute(
-                "INSERT INTO recognition_logs (user_id, recognized_at, items_count) VALUES (?, ?, ?)",
-                (user_id, recognized_at, items_count),
-            )
+        conn.execute(
+            "INSERT INTO recognition_logs (user_id, recognized_at, items_count) VALUES "
+            + _values_placeholders(len(recognition_history), 3),
+            [value for row in recognition_history for value in row],
+        )
 
-        conn.commit()
+    if inserted_recipes:
+        _recipes_version += 1
 
 
-def _get_or_create_ingredient_id(conn: sqlite3.Connection, name: str) -> int:
-    row = conn.execute(
-        "SELECT id FROM ingredients WHERE name_canonical = ?",
-        (name,),
-    ).fetchone()
-    if row:
-        return row["id"]
-    cursor = conn.execute(
-        "INSERT INTO ingredients (name_canonical) VALUES (?)",
-        (name,),
-    )
-    return cursor.lastrowid
+def _get_or_create_ingredient_id(
+    conn: sqlite3.Connection, name: str, cache: Dict[str, int]
+) -> int:
+    """Look the ingredient up in ``cache``, upserting it on a miss."""
+    ingredient_id = cache.get(name)
+    if ingredient_id is None:
+        ingredient_id = conn.execute(
+            """
+            INSERT INTO ingredients (name_canonical) VALUES (?)
+            ON CONFLICT(name_canonical) DO UPDATE SET name_canonical = excluded.name_canonical
+            RETURNING id
+            """,
+            (name,),
+        ).fetchone()["id"]
+        cache[name] = ingredient_id
+    return ingredient_id
 
 
+def recipes_version() -> int:
+    """Changes whenever seed_data() adds recipes; callers key recipe caches on it."""
+    return _recipes_version
 
 
 def fetch_recipes_with_ingredients() -> List[Dict[str, Any]]:
+    """Recipes with their recipe_ingredients rows aggregated in SQL."""
     with get_connection() as conn:
-        recipe_rows = conn.execute(
-            """
-            SELECT id, title, description, steps_json, ingredients_json, nutrition_json
-            FROM recipes
-            ORDER BY id ASC
-            """
-        ).fetchall()
-        recipes = [dict(row) for row in recipe_rows]
-
-        ingredient_rows = conn.execute(
+        rows = conn.execute(
             """
-            SELECT ri.recipe_id, i.name_canonical, ri.amount, ri.unit, ri.role
-            FROM recipe_ingredients ri
-            JOIN ingredients i ON i.id = ri.ingredient_id
-            ORDER BY ri.recipe_id ASC
+            SELECT r.id, r.title, r.description, r.steps_json, r.ingredients_json,
+                   r.nutrition_json,
+                   json_group_array(
+                       json_object(
+                           'name', i.name_canonical,
+                           'quantity', ri.amount,
+                           'unit', ri.unit,
+                           'role', ri.role
+                       )
+                   ) FILTER (WHERE ri.recipe_id IS NOT NULL) AS linked_ingredients_json
+            FROM recipes r
+            LEFT JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+            LEFT JOIN ingredients i ON i.id = ri.ingredient_id
+            GROUP BY r.id
+            ORDER BY r.id ASC
             """
         ).fetchall()
 
-    ing_map: Dict[int, List[Dict[str, Any]]] = {}
-    for row in ingredient_rows:
-        rid = row["recipe_id"]
-        ing_map.setdefault(rid, []).append(
-            {
-                "name": row["name_canonical"],
-                "quantity": row["amount"],
-                "unit": row["unit"],
-                "role": row["role"],
-            }
-        )
-
-    for recipe in recipes:
-        recipe["ingredients"] = ing_map.get(recipe["id"], [])
+    recipes = []
+    for row in rows:
+        recipe = _decode_recipe(row)
+        recipe["linked_ingredients"] = json_loads(recipe.pop("linked_ingredients_json"))
+        recipes.append(recipe)
     return recipes
 
 
-def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+def get_user_by_username(username: str) -> Optional[sqlite3.Row]:
     with get_connection() as conn:
         row = conn.execute(
             "SELECT id, username, password_hash FROM users WHERE username = ?",
             (username,),
         ).fetchone()
-    return dict(row) if row else None
+    return row
 
 
-def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+def get_user_by_id(user_id: int) -> Optional[sqlite3.Row]:
     with get_connection() as conn:
         row = conn.execute(
-            "SELECT id, username FROM users WHERE id = ?",
+            _SQL_GET_USER_BY_ID,
             (user_id,),
         ).fetchone()
-    return dict(row) if row else None
+    return row
 
 
 def create_user(username: str, password_hash: str) -> int:
@@ -356,18 +570,22 @@ def create_user(username: str, password_hash: str) -> int:
         return cursor.lastrowid
 
 
-def fetch_pantry_items(user_id: int) -> List[Dict[str, Any]]:
+def update_user_password_hash(user_id: int, password_hash: str) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE id = ?",
+            (password_hash, user_id),
+        )
+        conn.commit()
+
+
+def fetch_pantry_items(user_id: int) -> List[sqlite3.Row]:
     with get_connection() as conn:
         rows = conn.execute(
-            """
-            SELECT id, name, quantity, unit, expiry_date
-            FROM pantry_items
-            WHERE user_id = ?
-            ORDER BY id DESC
-            """,
+            _SQL_FETCH_PANTRY,
             (user_id,),
         ).fetchall()
-    return [dict(row) for row in rows]
+    return rows
 
 
 def upsert_pantry_item(
@@ -377,8 +595,19 @@ def upsert_pantry_item(
     unit: str,
     expiry_date: Optional[str] = None,
 ) -> None:
+    upsert_pantry_items(user_id, [(name, quantity, unit, expiry_date)])
+
+
+def upsert_pantry_items(
+    user_id: int,
+    items: Iterable[Tuple[str, int, str, Optional[str]]],
+) -> None:
+    """Upsert (name, quantity, unit, expiry_date) rows in a single transaction."""
+    rows = [(user_id, name, quantity, unit, expiry_date) for name, quantity, unit, expiry_date in items]
+    if not rows:
+        return
     with get_connection() as conn:
-        conn.execute(
+        conn.executemany(
             """
             INSERT INTO pantry_items (user_id, name, quantity, unit, expiry_date)
             VALUES (?, ?, ?, ?, ?)
@@ -388,7 +617,7 @@ def upsert_pantry_item(
                 unit = excluded.unit,
                 expiry_date = excluded.expiry_date
             """,
-            (user_id, name, quantity, unit, expiry_date),
+            rows,
         )
         conn.commit()
 
@@ -422,29 +651,62 @@ def delete_pantry_item(user_id: int, item_id: int) -> None:
         conn.commit()
 
 
-def fetch_recipes() -> List[Dict[str, Any]]:
+def get_recognize_items(user_id: int) -> List[Dict[str, Any]]:
+    """Return the recognized items in insertion order, each with its ``uid``."""
     with get_connection() as conn:
-        rows = conn.execute(
+        row = conn.execute(
+            _SQL_GET_RECOGNIZE_ITEMS,
+            (user_id,),
+        ).fetchone()
+    if not row:
+        return []
+    return [{"uid": uid, **item} for uid, item in json_loads(row["items_json"]).items()]
+
+
+def set_recognize_items(user_id: int, items: Dict[str, Dict[str, Any]]) -> None:
+    with get_connection() as conn:
+        conn.execute(
             """
-            SELECT id, title, description, steps_json, ingredients_json, nutrition_json
-            FROM recipes
-            ORDER BY id ASC
+            INSERT INTO recognize_session (user_id, items_json)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET items_json = excluded.items_json
+            """,
+            (user_id, json_dumps(items).decode()),
+        )
+        conn.commit()
+
+
+def update_recognize_item(user_id: int, uid: str, item: Dict[str, Any]) -> None:
+    """Replace one recognized item in place; unknown uids are ignored."""
+    with get_connection() as conn:
+        conn.execute(
             """
-        ).fetchall()
-    return [dict(row) for row in rows]
+            UPDATE recognize_session
+            SET items_json = json_replace(items_json, '$."' || ? || '"', json(?))
+            WHERE user_id = ?
+            """,
+            (uid, json_dumps(item).decode(), user_id),
+        )
+        conn.commit()
 
 
-def fetch_recipe_by_id(recipe_id: int) -> Optional[Dict[str, Any]]:
+def delete_recognize_item(user_id: int, uid: str) -> None:
     with get_connection() as conn:
-        row = conn.execute(
+        conn.execute(
             """
-            SELECT id, title, description, steps_json, ingredients_json, nutrition_json
-            FROM recipes
-            WHERE id = ?
+            UPDATE recognize_session
+            SET items_json = json_remove(items_json, '$."' || ? || '"')
+            WHERE user_id = ?
             """,
-            (recipe_id,),
-        ).fetchone()
-    return dict(row) if row else None
+            (uid, user_id),
+        )
+        conn.commit()
+
+
+def clear_recognize_items(user_id: int) -> None:
+    with get_connection() as conn:
+        conn.execute("DELETE FROM recognize_session WHERE user_id = ?", (user_id,))
+        conn.commit()
 
 
 def add_cooking_log(user_id: int, recipe_id: int, cooked_at_date: str) -> None:
@@ -461,7 +723,7 @@ def add_cooking_log(user_id: int, recipe_id: int, cooked_at_date: str) -> None:
 
 def fetch_cooking_logs_range(
     user_id: int, start_date: str, end_date: str
-) -> List[Dict[str, Any]]:
+) -> List[sqlite3.Row]:
     with get_connection() as conn:
         rows = conn.execute(
             """
@@ -472,7 +734,31 @@ def fetch_cooking_logs_range(
             """,
             (user_id, start_date, end_date),
         ).fetchall()
-    return [dict(row) for row in rows]
+    return rows
+
+
+def fetch_recent_cooked_recipes(
+    user_id: int, start_date: str, end_date: str, limit: int = 3
+) -> List[sqlite3.Row]:
+    """Return distinct recipes cooked in the range, most recently cooked first."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            _SQL_FETCH_RECENT_COOKED_RECIPES,
+            (user_id, start_date, end_date, limit),
+        ).fetchall()
+    return rows
+
+
+def fetch_daily_nutrition_totals(
+    user_id: int, start_date: str, end_date: str
+) -> List[sqlite3.Row]:
+    """Sum kcal/protein/veg_score of the recipes cooked on each day in the range."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            _SQL_FETCH_DAILY_NUTRITION_TOTALS,
+            (user_id, start_date, end_date),
+        ).fetchall()
+    return rows
 
 
 def add_recognition_log(user_id: int, recognized_at: str, items_count: int) -> None:
@@ -487,39 +773,37 @@ def add_recognition_log(user_id: int, recognized_at: str, items_count: int) -> N
         conn.commit()
 
 
-def fetch_recognition_logs(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+def fetch_recognition_logs(user_id: int, limit: int = 10) -> List[sqlite3.Row]:
     with get_connection() as conn:
         rows = conn.execute(
-            """
-            SELECT id, user_id, recognized_at, items_count
-            FROM recognition_logs
-            WHERE user_id = ?
-            ORDER BY recognized_at DESC
-            LIMIT ?
-            """,
+            _SQL_FETCH_RECOGNITION_LOGS,
             (user_id, limit),
         ).fetchall()
-    return [dict(row) for row in rows]
+    return rows
+
+
+def fetch_recognition_log_count(user_id: int) -> int:
+    with get_connection() as conn:
+        result = conn.execute(
+            _SQL_COUNT_RECOGNITION_LOGS,
+            (user_id,),
+        ).fetchone()
+    return result["count"] if result else 0
 
 
-def fetch_expiry_alerts(user_id: int) -> List[Dict[str, Any]]:
+def fetch_expiry_alerts(user_id: int) -> List[sqlite3.Row]:
     with get_connection() as conn:
         rows = conn.execute(
-            """
-            SELECT id, name, quantity, unit, expiry_date
-            FROM pantry_items
-            WHERE user_id = ? AND expiry_date IS NOT NULL AND expiry_date <= date('now', '+7 days')
-            ORDER BY expiry_date ASC
-            """,
+            _SQL_FETCH_EXPIRY_ALERTS,
             (user_id,),
         ).fetchall()
-    return [dict(row) for row in rows]
+    return rows
 
 
 def fetch_cooking_log_count(user_id: int) -> int:
     with get_connection() as conn:
         result = conn.execute(
-            "SELECT COUNT(DISTINCT recipe_id) as count FROM cooking_log WHERE user_id = ?",
+            _SQL_COUNT_COOKED_RECIPES,
             (user_id,),
         ).fetchone()
     return result["count"] if result else 0
@@ -528,13 +812,28 @@ def fetch_cooking_log_count(user_id: int) -> int:
 def search_recipes(keyword: str) -> List[Dict[str, Any]]:
     """Search recipes by title or description."""
     with get_connection() as conn:
-        rows = conn.execute(
-            """
-            SELECT id, title, description, ingredients_json, nutrition_json
-            FROM recipes
-            WHERE LOWER(title) LIKE LOWER(?) OR LOWER(description) LIKE LOWER(?)
-            ORDER BY title ASC
-            """,
-            (f"%{keyword}%", f"%{keyword}%"),
-        ).fetchall()
-    return [dict(row) for row in rows]
+        if _fts_enabled and len(keyword) >= FTS_MIN_QUERY_LENGTH:
+            # Quoted as one phrase so the keyword is matched literally.
+            phrase = '"%s"' % keyword.replace('"', '""')
+            rows = conn.execute(
+                """
+                SELECT r.id, r.title, r.description, r.ingredients_json, r.nutrition_json
+                FROM recipes_fts f
+                JOIN recipes r ON r.id = f.rowid
+                WHERE recipes_fts MATCH ?
+                ORDER BY r.title ASC
+                """,
+                (phrase,),
+            ).fetchall()
+        else:
+            # Too short for a trigram lookup; scan like before.
+            rows = conn.execute(
+                """
+                SELECT id, title, description, ingredients_json, nutrition_json
+                FROM recipes
+                WHERE LOWER(title) LIKE LOWER(?) OR LOWER(description) LIKE LOWER(?)
+                ORDER BY title ASC
+                """,
+                (f"%{keyword}%", f"%{keyword}%"),
+            ).fetchall()
+    return [_decode_recipe(row) for row in rows]
@@ -0,0 +1,13 @@
+"""Gunicorn settings for serving the app in production."""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+keepalive = 5
+
+# Import the app once in the master so init_db()/seed_data() run a single time
+# and the process-level caches are shared copy-on-write with the workers.
+preload_app = True
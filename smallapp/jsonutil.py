@@ -0,0 +1,39 @@
+"""JSON helpers that use orjson when it is installed."""
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(
+    obj: Any,
+    *,
+    default: Optional[Callable[[Any], Any]] = None,
+    sort_keys: bool = False,
+    indent: bool = False,
+) -> bytes:
+    """Serialize ``obj`` to UTF-8 JSON bytes."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(
+        obj,
+        default=default,
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+    ).encode("utf-8")
@@ -1,11 +1,13 @@
 import base64
-import json
 import os
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 import openai
 from openai import OpenAI
 
+from jsonutil import loads as json_loads
+
 
 class OpenAIVisionError(Exception):
     pass
@@ -48,6 +50,12 @@ def _normalize_bbox(value: Any) -> Optional[Dict[str, float]]:
     return {"x": clamp(x), "y": clamp(y), "w": clamp(w), "h": clamp(h)}
 
 
+@lru_cache(maxsize=4)
+def _client(timeout_seconds: int) -> OpenAI:
+    # Reused so the underlying httpx connection pool (and TLS sessions) persist.
+    return OpenAI(timeout=timeout_seconds)
+
+
 def recognize_ingredients_from_bytes(
     image_bytes: bytes,
     mime_type: str,
@@ -57,9 +65,12 @@ def recognize_ingredients_from_bytes(
     if not os.environ.get("OPENAI_API_KEY"):
         raise MissingAPIKeyError("OPENAI_API_KEY is not set.")
 
-    client = OpenAI(timeout=timeout_seconds)
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
-    data_url = f"data:{mime_type};base64,{b64}"
+    client = _client(timeout_seconds)
+    # Joining as bytes skips one full-size str copy; peak memory is unchanged,
+    # since the base64 bytes and the joined URL are briefly alive together.
+    data_url = b"".join(
+        (b"data:", mime_type.encode("utf-8"), b";base64,", base64.b64encode(image_bytes))
+    ).decode("utf-8")
 
     try:
         response = client.responses.create(
@@ -127,8 +138,8 @@ def recognize_ingredients_from_bytes(
 
     raw_text = (response.output_text or "").strip()
     try:
-        payload = json.loads(raw_text)
-    except json.JSONDecodeError as exc:
+        payload = json_loads(raw_text)
+    except ValueError as exc:
         raise NonJsonResponseError("Model did not return valid JSON.") from exc
 
     if not isinstance(payload, dict):